@@ -4,22 +4,46 @@ Script untuk mengambil data OLT Fiberhome AN6000-17 via SNMP
 Mengambil metrik: Board, PON Port, ONU Information
 """
 
-import pandas as pd
-import subprocess
+import asyncio
+import csv
+import json
 import re
+import sys
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, MemoryHandler
 
-SNMP_COMMUNITY = "public"
-SNMP_VERSION = "2c"
-SNMP_TIMEOUT = 30
-MAX_WORKERS = 5
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-# Standard OIDs
-OID_SYS_DESCR = "1.3.6.1.2.1.1.1.0"
-OID_SYS_NAME = "1.3.6.1.2.1.1.5.0"
+# snmp_core.py ada di root repo, dipakai bersama semua script vendor
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from snmp_core import (
+    SNMP_COMMUNITY,
+    SNMP_COMMAND_TIMEOUT,
+    SNMP_RETRY_TIMEOUTS,
+    SNMP_PDU_TIMEOUT,
+    SNMP_PDU_RETRIES,
+    MAX_WORKERS,
+    SNMP_MAX_REPETITIONS_PER_OID,
+    OID_CACHE_EXCLUDE,
+    Metric,
+    run_snmp_walk_cached,
+    run_snmp_walks_cached,
+    iter_snmp_values,
+    count_integer_buckets,
+    collect_metrics,
+    get_system_info,
+    load_oid_cache,
+    save_oid_cache,
+    ip_sort_key,
+    run_all,
+    uvloop
+)
 
 # Fiberhome specific OIDs (Enterprise: 5875)
 OID_FH_CARD_STATUS = "1.3.6.1.4.1.5875.800.3.9.2.1.1.5"
@@ -28,157 +52,104 @@ OID_FH_PON_PORT_TYPE = "1.3.6.1.4.1.5875.800.3.9.3.4.1.1"
 OID_FH_PON_PORT_NAME = "1.3.6.1.4.1.5875.800.3.9.3.4.1.2"
 OID_FH_ONU_STATUS = "1.3.6.1.4.1.5875.800.3.10.1.1.11"
 
+# max-repetitions GETBULK per kolom: tabel board kecil, tabel ONT besar
+SNMP_MAX_REPETITIONS_PER_OID.update({
+    OID_FH_CARD_STATUS: 10,
+    OID_FH_CARD_TYPE: 10,
+    OID_FH_ONU_STATUS: 50,
+})
+OID_CACHE_EXCLUDE.add(OID_FH_ONU_STATUS)
+
+# Metrik yang cukup dihitung dari satu kolom
+# Card Status: 1 = active/normal
+# ONU Status: 0=deregistered, 1=online, 2=offline, 3=unknown
+METRICS = (
+    Metric(OID_FH_CARD_STATUS, "board_installed"),
+    Metric(OID_FH_CARD_STATUS, "board_used", ("1",)),
+    Metric(OID_FH_ONU_STATUS, "onu_installed", ("0",), exclude=True),
+    Metric(OID_FH_ONU_STATUS, "onu_online", ("1",)),
+)
+
+# Regex model OLT dari sysDescr
+_RE_AN6000 = re.compile(r'AN6000[^\s,]*', re.IGNORECASE)
+
 output_dir = Path("output") / datetime.now().strftime("%Y-%m-%d")
 output_dir.mkdir(parents=True, exist_ok=True)
 
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 log_file = output_dir / f"olt_fiberhome_{timestamp}.log"
 
+# Record masuk queue, file/console ditulis oleh thread listener
+# supaya event loop tidak menunggu I/O log
+# File log ditulis per 1000 record (langsung jika ada ERROR) dan baru
+# dibuka saat record pertama ditulis
+log_queue = queue.Queue(-1)
+log_file_handler = MemoryHandler(
+    1000,
+    flushLevel=logging.ERROR,
+    target=logging.FileHandler(log_file, delay=True)
+)
+log_listener = QueueListener(
+    log_queue,
+    log_file_handler,
+    logging.StreamHandler()
+)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
 
 
-def run_snmp_command(ip, oid, walk=True):
-    try:
-        cmd = [
-            "snmpwalk" if walk else "snmpget",
-            "-v", SNMP_VERSION,
-            "-c", SNMP_COMMUNITY,
-            "-t", str(SNMP_TIMEOUT),
-            "-r", "2",
-            ip,
-            oid
-        ]
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=SNMP_TIMEOUT + 10
-        )
-        
-        return result.stdout if result.returncode == 0 else None
-            
-    except:
-        return None
-
-
-def parse_snmp_output(output, full_index=False):
-    if not output:
-        return {}
-    
-    data = {}
-    lines = output.strip().split('\n')
-    
-    for line in lines:
-        if '=' not in line:
-            continue
-            
-        parts = line.split('=', 1)
-        if len(parts) != 2:
-            continue
-            
-        oid_part = parts[0].strip()
-        value_part = parts[1].strip()
-        
-        if full_index:
-            pattern = r'\.(\d+(?:\.\d+)*)$'
-            match = re.search(pattern, oid_part)
-            index = match.group(1) if match else oid_part.split('.')[-1]
-        else:
-            index = oid_part.split('.')[-1]
-        
-        value = re.sub(r'^[A-Za-z\-]+:\s*', '', value_part)
-        value = value.strip('"').strip()
-        
-        data[index] = value
-    
-    return data
-
-
-def get_olt_model(ip):
-    output = run_snmp_command(ip, OID_SYS_DESCR, walk=False)
-    if output:
-        match = re.search(r'AN6000[^\s,]*', output, re.IGNORECASE)
+def parse_olt_model(sys_descr):
+    if sys_descr:
+        match = _RE_AN6000.search(sys_descr)
         if match:
             return match.group(0)
-        if 'fiberhome' in output.lower():
-            parts = output.split('=')
-            if len(parts) > 1:
-                return parts[1].strip().split()[0]
+        if 'fiberhome' in sys_descr.lower():
+            return sys_descr.split()[0]
     return "Unknown"
 
 
-def get_olt_sysname(ip):
-    output = run_snmp_command(ip, OID_SYS_NAME, walk=False)
-    if output:
-        parts = output.split('=')
-        if len(parts) > 1:
-            value = re.sub(r'^[A-Za-z\-]+:\s*', '', parts[1].strip())
-            return value.strip('"').strip()
-    return "Unknown"
-
-
-def get_board_status(ip):
+async def get_board_count_from_type(ip):
     """
-    Mengambil status board dari Fiberhome
-    Card Status: 1 = active/normal
+    Fallback jumlah card dari Card Type kalau Card Status kosong
+    Semua card yang terdeteksi dianggap installed dan used
     """
     try:
-        status_output = run_snmp_command(ip, OID_FH_CARD_STATUS)
-        
-        if status_output:
-            statuses = parse_snmp_output(status_output, full_index=False)
-            installed = len(statuses)
-            used = len([v for v in statuses.values() if v == "1"])
-            
-            if installed > 0:
-                logging.info(f"{ip}: Found {installed} cards installed, {used} active")
-                return {"installed": installed, "used": used}
-        
-        type_output = run_snmp_command(ip, OID_FH_CARD_TYPE)
+        type_output = await run_snmp_walk_cached(ip, OID_FH_CARD_TYPE)
         if type_output:
-            types = parse_snmp_output(type_output, full_index=False)
-            installed = len(types)
-            used = installed
-            
+            installed = sum(1 for _ in iter_snmp_values(type_output))
             logging.info(f"{ip}: Found {installed} cards (from type info)")
-            return {"installed": installed, "used": used}
+            return installed
         
         logging.warning(f"{ip}: Could not get board count")
-        return {"installed": 0, "used": 0}
+        return 0
         
     except Exception as e:
-        logging.error(f"Error getting board status for {ip}: {str(e)}")
-        return {"installed": 0, "used": 0}
+        logging.error(f"Error getting board status for {ip}: {str(e)}", exc_info=True)
+        return 0
 
 
-def get_pon_port_status(ip):
+async def get_pon_port_status(ip):
     """
     Mengambil status PON port dari Fiberhome
     Returns: dict dengan 'installed' dan 'used'
     """
     try:
-        type_output = run_snmp_command(ip, OID_FH_PON_PORT_TYPE)
+        outputs = await run_snmp_walks_cached(ip, [OID_FH_PON_PORT_TYPE, OID_FH_PON_PORT_NAME])
+        type_output = outputs[OID_FH_PON_PORT_TYPE]
+        name_output = outputs[OID_FH_PON_PORT_NAME]
         
         if not type_output:
             logging.warning(f"{ip}: Could not get PON port data")
             return {"installed": 0, "used": 0}
         
-        types = parse_snmp_output(type_output, full_index=False)
-        installed = len([v for v in types.values() if v == "1"])
-        
-        name_output = run_snmp_command(ip, OID_FH_PON_PORT_NAME)
+        installed = count_integer_buckets(type_output)["1"]
         
         if name_output:
-            names = parse_snmp_output(name_output, full_index=False)
-            used = len([v for v in names.values() if v and "PON" in v.upper()])
+            used = sum(1 for v in iter_snmp_values(name_output) if v and "PON" in v.upper())
         else:
             used = installed
         
@@ -186,35 +157,11 @@ def get_pon_port_status(ip):
         return {"installed": installed, "used": used}
         
     except Exception as e:
-        logging.error(f"Error getting PON port status for {ip}: {str(e)}")
+        logging.error(f"Error getting PON port status for {ip}: {str(e)}", exc_info=True)
         return {"installed": 0, "used": 0}
 
 
-def get_onu_status(ip):
-    """
-    Mengambil status ONU dari Fiberhome
-    ONU Status: 0=deregistered, 1=online, 2=offline, 3=unknown
-    """
-    try:
-        onu_status_output = run_snmp_command(ip, OID_FH_ONU_STATUS)
-        
-        if not onu_status_output:
-            logging.warning(f"{ip}: Could not get ONU data")
-            return {"installed": 0, "online": 0}
-        
-        statuses = parse_snmp_output(onu_status_output, full_index=False)
-        installed = len([v for v in statuses.values() if v != "0"])
-        online = len([v for v in statuses.values() if v == "1"])
-        
-        logging.info(f"{ip}: Found {installed} ONU installed, {online} online")
-        return {"installed": installed, "online": online}
-        
-    except Exception as e:
-        logging.error(f"Error getting ONU status for {ip}: {str(e)}")
-        return {"installed": 0, "online": 0}
-
-
-def collect_olt_data(ip):
+async def collect_olt_data(ip):
     logging.info(f"Processing OLT: {ip}")
     
     result = {
@@ -232,33 +179,33 @@ def collect_olt_data(ip):
     }
     
     try:
-        test = run_snmp_command(ip, OID_SYS_DESCR, walk=False)
-        if not test:
+        sys_descr, sys_name = await get_system_info(ip)
+        if sys_descr is None:
             result["error"] = "timeout/unreachable"
             logging.warning(f"{ip}: Timeout/Unreachable")
             return result
         
-        result["sysname"] = get_olt_sysname(ip)
-        result["model"] = get_olt_model(ip)
+        result["sysname"] = sys_name
+        result["model"] = parse_olt_model(sys_descr)
         
-        board_status = get_board_status(ip)
-        result["board_installed"] = board_status["installed"]
-        result["board_used"] = board_status["used"]
+        # Semua walk setelah sysDescr jalan bersamaan
+        metrics, pon_status = await asyncio.gather(
+            collect_metrics(ip, METRICS),
+            get_pon_port_status(ip)
+        )
+        result.update(metrics)
+        if result["board_installed"] == 0:
+            result["board_installed"] = result["board_used"] = await get_board_count_from_type(ip)
         
-        pon_status = get_pon_port_status(ip)
         result["pon_port_installed"] = pon_status["installed"]
         result["pon_port_used"] = pon_status["used"]
         
-        onu_status = get_onu_status(ip)
-        result["onu_installed"] = onu_status["installed"]
-        result["onu_online"] = onu_status["online"]
-        
         result["status"] = "OK"
         logging.info(f"{ip}: OK - {result['sysname']} | Board: {result['board_used']}/{result['board_installed']} | PON: {result['pon_port_used']}/{result['pon_port_installed']} | ONU: {result['onu_online']}/{result['onu_installed']}")
         
     except Exception as e:
         result["error"] = str(e)
-        logging.error(f"{ip}: Error - {str(e)}")
+        logging.error(f"{ip}: Error - {str(e)}", exc_info=True)
     
     return result
 
@@ -279,8 +226,12 @@ def main():
     
     try:
         with open(input_file, 'r') as f:
-            ip_list = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-        ip_list = list(set(ip_list))
+            # Hapus duplikat lalu urutkan per oktet, urutan proses,
+            # log dan output jadi sama di setiap run
+            ip_list = sorted(
+                dict.fromkeys(line.strip() for line in f if line.strip() and not line.startswith('#')),
+                key=ip_sort_key
+            )
     except Exception as e:
         print(f"Error membaca file: {str(e)}")
         return
@@ -290,45 +241,66 @@ def main():
         return
     
     print(f"\nTotal IP: {len(ip_list)}")
-    print(f"Max workers: {MAX_WORKERS}")
+    print(f"Max workers: {min(MAX_WORKERS, len(ip_list))} (OLT_MAX_WORKERS={MAX_WORKERS})")
+    print(f"Event loop: {'uvloop' if uvloop else 'asyncio'}")
     print(f"SNMP Community: {SNMP_COMMUNITY}")
-    print(f"Timeout: {SNMP_TIMEOUT}s\n")
+    print(f"Timeout: {'/'.join(map(str, SNMP_RETRY_TIMEOUTS))}s cek reachability, {SNMP_PDU_TIMEOUT}s x {SNMP_PDU_RETRIES + 1} per PDU, {SNMP_COMMAND_TIMEOUT}s per perintah\n")
     
     logging.info(f"Memulai proses untuk {len(ip_list)} IP")
+    load_oid_cache()
     
     results = []
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_ip = {executor.submit(collect_olt_data, ip): ip for ip in ip_list}
-        
-        for future in as_completed(future_to_ip):
-            try:
-                results.append(future.result())
-            except Exception as e:
-                ip = future_to_ip[future]
-                logging.error(f"Exception untuk {ip}: {str(e)}")
-                results.append({"ip": ip, "status": "error", "error": str(e)})
+    for ip, result in zip(ip_list, run_all(collect_olt_data, ip_list)):
+        if isinstance(result, Exception):
+            logging.error(f"Exception untuk {ip}: {str(result)}", exc_info=result)
+            result = {"ip": ip, "status": "error", "error": str(result)}
+        results.append(result)
     
-    df = pd.DataFrame(results).sort_values('ip').reset_index(drop=True)
+    save_oid_cache(ip_list)
+    
+    # Semua baris punya kolom yang sama (baris error diisi None),
+    # urutan sudah sama dengan ip_list
+    fieldnames = list(dict.fromkeys(key for result in results for key in result))
+    rows = [{key: result.get(key) for key in fieldnames} for result in results]
     
     base = f"olt_fiberhome_{timestamp}"
     csv_file = output_dir / f"{base}.csv"
     json_file = output_dir / f"{base}.json"
     
-    df.to_csv(csv_file, index=False)
-    df.to_json(json_file, orient='records', indent=2)
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    if orjson:
+        json_file.write_bytes(orjson.dumps(rows, option=orjson.OPT_INDENT_2))
+    else:
+        with open(json_file, 'w') as f:
+            json.dump(rows, f, indent=2)
     
     print(f"\nCSV: {csv_file}")
     print(f"JSON: {json_file}")
     print(f"Log: {log_file}")
     
-    total = len(results)
-    success = len([r for r in results if r['status'] == 'OK'])
-    total_board_installed = sum([r.get('board_installed', 0) for r in results if r['status'] == 'OK'])
-    total_board_used = sum([r.get('board_used', 0) for r in results if r['status'] == 'OK'])
-    total_pon_installed = sum([r.get('pon_port_installed', 0) for r in results if r['status'] == 'OK'])
-    total_pon_used = sum([r.get('pon_port_used', 0) for r in results if r['status'] == 'OK'])
-    total_onu_installed = sum([r.get('onu_installed', 0) for r in results if r['status'] == 'OK'])
-    total_onu_online = sum([r.get('onu_online', 0) for r in results if r['status'] == 'OK'])
+    # Success dan semua total dihitung dalam satu pass
+    total = len(rows)
+    success = 0
+    totals = dict.fromkeys([
+        'board_installed', 'board_used',
+        'pon_port_installed', 'pon_port_used',
+        'onu_installed', 'onu_online'
+    ], 0)
+    for row in rows:
+        if row['status'] != 'OK':
+            continue
+        success += 1
+        for key in totals:
+            totals[key] += row[key]
+    total_board_installed = totals['board_installed']
+    total_board_used = totals['board_used']
+    total_pon_installed = totals['pon_port_installed']
+    total_pon_used = totals['pon_port_used']
+    total_onu_installed = totals['onu_installed']
+    total_onu_online = totals['onu_online']
     
     print(f"\n{'=' * 70}")
     print(f"SUMMARY")
@@ -350,4 +322,9 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    log_listener.start()
+    try:
+        main()
+    finally:
+        log_listener.stop()
+        log_file_handler.close()
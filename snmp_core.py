@@ -0,0 +1,652 @@
+"""
+Fungsi SNMP bersama untuk script OLT Huawei, ZTE dan Fiberhome
+Menjalankan snmpget/snmpbulkwalk (net-snmp), parsing output dan cache OID
+"""
+
+import asyncio
+import re
+from collections import namedtuple, Counter
+from functools import lru_cache
+import json
+import os
+import time
+from pathlib import Path
+import logging
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+SNMP_COMMUNITY = "public"
+SNMP_VERSION = "2c"
+SNMP_TIMEOUT = 30
+# Batas waktu satu proses snmp* (walk panjang bisa melewati SNMP_TIMEOUT)
+SNMP_COMMAND_TIMEOUT = SNMP_TIMEOUT + 10
+# Timeout per PDU cek reachability, pendek lalu naik tiap retry
+SNMP_RETRY_TIMEOUTS = (2, 4, 8)
+# Timeout dan retransmit per PDU setelah OLT terbukti menjawab
+SNMP_PDU_TIMEOUT = 5
+SNMP_PDU_RETRIES = 2
+SNMP_MAX_REPETITIONS = 25
+
+
+def read_env_limit(name, default):
+    """
+    Batas concurrency dari environment, minimal 1
+    (0 worker tidak memproses OLT, Semaphore(0) menunggu selamanya)
+    Nilai yang tidak valid menghentikan script dengan pesan yang jelas
+    """
+    value = os.environ.get(name, str(default))
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise SystemExit(f"{name} harus bilangan bulat >= 1, bukan {value!r}")
+    return limit
+
+
+# Jumlah OLT yang diproses bersamaan, bisa diubah lewat environment
+# tanpa edit script (worker hanya menunggu I/O, jadi bisa besar)
+MAX_WORKERS = read_env_limit("OLT_MAX_WORKERS", 100)
+# Batas proses snmpget/snmpbulkwalk yang jalan bersamaan (walk per OLT
+# paralel, jadi bisa beberapa proses per worker), menjaga jumlah fd
+MAX_SNMP_PROCESSES = read_env_limit("OLT_MAX_SNMP_PROCESSES", 200)
+
+# max-repetitions GETBULK per kolom, diisi oleh script vendor
+SNMP_MAX_REPETITIONS_PER_OID = {}
+
+# Cache leaf OID hasil walk (topologi OLT jarang berubah)
+OID_CACHE_FILE = Path("output") / "oid_cache.json"
+REFRESH_OIDS_CACHE_INTERVAL = 3600
+OID_BATCH_SIZE = 32
+
+# Kolom besar yang sering berubah (tabel ONT), selalu di-walk tanpa cache,
+# diisi oleh script vendor
+OID_CACHE_EXCLUDE = set()
+
+OID_SYS_DESCR = "1.3.6.1.2.1.1.1.0"
+OID_SYS_NAME = "1.3.6.1.2.1.1.5.0"
+OID_SYS_UPTIME = "1.3.6.1.2.1.1.3.0"
+OID_IF_TABLE_LAST_CHANGE = "1.3.6.1.2.1.31.1.5.0"
+
+# Selisih waktu boot (detik) yang masih dianggap boot yang sama
+BOOT_TIME_TOLERANCE = 60
+
+# Regex dipakai per baris output snmpwalk, compile sekali saja
+_RE_INTEGER_VALUE = re.compile(rb'INTEGER: (-?\d+)')
+# Satu match per baris "<oid>.<index> = TYPE: value" -> (index, value)
+_RE_LINE = re.compile(rb'^\S*\.(\d+)\s*=\s*(?:[A-Za-z\-]+:\s*)?"?(.*?)"?\s*$')
+
+# Metrik hitungan per kolom OID: jumlah baris INTEGER yang value-nya ada
+# di values (None = semua baris), exclude=True -> semua baris kecuali values
+Metric = namedtuple('Metric', ['oid', 'key', 'values', 'exclude'], defaults=(None, False))
+
+oid_cache = {}
+# Dibuat di collect_all, di dalam event loop yang dipakai
+snmp_slots = None
+
+
+async def run_snmp_command(ip, oid, walk=True, reader=None, probe=False):
+    """
+    Jalankan snmpbulkwalk/snmpget
+    probe=True untuk cek reachability: tanpa retransmit, timeout per PDU
+    naik tiap retry (SNMP_RETRY_TIMEOUTS), host mati gagal dalam 2+4+8
+    detik. Selain itu OLT sudah terbukti menjawab, jadi satu proses
+    dengan retransmit per PDU, satu paket hilang di tengah walk panjang
+    tidak membuat walk diulang dari awal
+    reader: coroutine yang membaca stdout proses (default: baca semua),
+    dipanggil ulang dari awal di setiap retry
+    Returns: hasil reader (bytes stdout), None jika gagal. Untuk probe,
+    stdout tetap dikembalikan (bisa kosong) kalau agent menjawab dengan
+    error (noSuchName/genErr), None hanya jika agent tidak menjawab
+    """
+    # Walk pakai GETBULK (snmpbulkwalk), output OID numerik (-On)
+    # dan nilai enum numerik (-Oe) supaya tidak ada translasi MIB
+    args = ["-v", SNMP_VERSION, "-c", SNMP_COMMUNITY, "-On", "-Oe"]
+    if walk:
+        args.append(f"-Cr{SNMP_MAX_REPETITIONS_PER_OID.get(oid, SNMP_MAX_REPETITIONS)}")
+    args.append(ip)
+    args += oid if isinstance(oid, list) else [oid]
+    
+    if probe:
+        attempts = [(retry_timeout, 0) for retry_timeout in SNMP_RETRY_TIMEOUTS]
+    else:
+        attempts = [(SNMP_PDU_TIMEOUT, SNMP_PDU_RETRIES)]
+    
+    for pdu_timeout, retries in attempts:
+        async with snmp_slots:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    "snmpbulkwalk" if walk else "snmpget",
+                    "-t", str(pdu_timeout),
+                    "-r", str(retries),
+                    *args,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+            except OSError as e:
+                # net-snmp tidak terpasang / fd habis, error lain diteruskan
+                logging.error(f"{ip}: Could not run net-snmp: {str(e)}")
+                return None
+            
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    asyncio.gather((reader or read_stream)(process.stdout), process.stderr.read()),
+                    timeout=SNMP_COMMAND_TIMEOUT
+                )
+                await process.wait()
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                return None
+            except BaseException:
+                # Dibatalkan (CancelledError/KeyboardInterrupt), jangan
+                # tinggalkan proses snmp yang masih jalan
+                if process.returncode is None:
+                    process.kill()
+                raise
+        
+        if process.returncode == 0:
+            return stdout
+        
+        # Hanya retry kalau agent tidak menjawab
+        if b"Timeout" not in stderr:
+            return stdout if probe else None
+    
+    return None
+
+
+@lru_cache(maxsize=None)
+def make_parser(base_oid=None):
+    """
+    Buat iterator (index, value) bytes untuk satu bentuk index, jadi
+    tidak ada cek mode per baris. Dibuat sekali per base_oid (cache)
+    Tanpa base_oid index = sub-id terakhir (ifIndex)
+    Dengan base_oid hanya baris di bawah base_oid, index = semua sub-id
+    setelah base_oid (compound index ONT, contoh: 4194304000.12)
+    """
+    if base_oid is None:
+        def iter_lines(output):
+            for line in output.splitlines():
+                oid_part, eq, rest = line.partition(b' = ')
+                # Regex hanya untuk baris yang tidak berbentuk " = "
+                if not eq:
+                    match = _RE_LINE.match(line)
+                    if match:
+                        yield match.group(1), match.group(2)
+                    continue
+                
+                _, colon, value = rest.partition(b': ')
+                yield oid_part.rpartition(b'.')[2], (value if colon else rest).strip().strip(b'"')
+        
+        return iter_lines
+    
+    prefix = f".{base_oid}.".encode()
+    skip = len(prefix)
+    
+    def iter_lines(output):
+        for line in output.splitlines():
+            if not line.startswith(prefix):
+                continue
+            
+            oid_part, eq, rest = line.partition(b' = ')
+            if not eq:
+                continue
+            
+            _, colon, value = rest.partition(b': ')
+            yield oid_part[skip:], (value if colon else rest).strip().strip(b'"')
+    
+    return iter_lines
+
+
+def iter_snmp_lines(output, base_oid=None):
+    """
+    Yield (index, value) bytes per baris "<oid>.<index> = TYPE: value"
+    memakai parser dari make_parser(base_oid)
+    """
+    return make_parser(base_oid)(output)
+
+
+async def read_stream(stream):
+    return await stream.read()
+
+
+async def count_stream_buckets(stream):
+    """
+    Reader untuk run_snmp_command: hitung nilai INTEGER per baris selama
+    snmpbulkwalk masih jalan, tanpa menyimpan seluruh output di memori
+    """
+    buckets = Counter()
+    async for line in stream:
+        match = _RE_INTEGER_VALUE.search(line)
+        if match:
+            buckets[match.group(1).decode()] += 1
+    return buckets
+
+
+def parse_snmp_output(output, base_oid=None):
+    if not output:
+        return {}
+    
+    # Output snmp tetap bytes, yang di-decode hanya index dan value
+    return {index.decode(): value.decode('utf-8', 'replace') for index, value in iter_snmp_lines(output, base_oid)}
+
+
+def iter_snmp_values(output):
+    """
+    Seperti parse_snmp_output tapi hanya yield value per baris,
+    untuk pemanggil yang cuma butuh hitungan (tanpa membangun dict)
+    """
+    if not output:
+        return
+    
+    for _, value in iter_snmp_lines(output):
+        yield value.decode('utf-8', 'replace')
+
+
+def count_integer_buckets(output):
+    """
+    Hitungan per nilai INTEGER di output dalam satu pass
+    Returns: Counter {value (str): jumlah baris}
+    """
+    if not output:
+        return Counter()
+    return Counter(value.decode() for value in _RE_INTEGER_VALUE.findall(output))
+
+
+def parse_snmp_get(output):
+    """
+    Parsing output snmpget "<oid> = TYPE: value"
+    Returns: dict {oid: value}
+    """
+    values = {}
+    if output:
+        for line in output.splitlines():
+            oid_part, eq, rest = line.partition(b' = ')
+            if not eq:
+                continue
+            _, colon, value = rest.partition(b': ')
+            if not colon:
+                value = rest
+            values[oid_part.lstrip(b'.').decode()] = value.strip().strip(b'"').decode('utf-8', 'replace')
+    return values
+
+
+async def run_snmp_get(ip, oids):
+    """
+    Mengambil beberapa OID scalar dalam satu PDU snmpget
+    Returns: dict {oid: value}
+    """
+    return parse_snmp_get(await run_snmp_command(ip, oids, walk=False))
+
+
+def parse_timeticks(value):
+    """
+    "(123456) 0:20:34.56" -> 123456, None jika bukan Timeticks
+    """
+    ticks = (value or "").partition(')')[0].lstrip('(')
+    return int(ticks) if ticks.isdigit() else None
+
+
+def check_oid_cache_token(ip, uptime, last_change):
+    """
+    Cache OID per IP hanya valid selama OLT tidak reboot (waktu boot dari
+    sysUpTime) dan ifTable tidak berubah (ifTableLastChange)
+    Kalau salah satu berubah, cache IP tersebut dibuang sebelum walk
+    """
+    uptime = parse_timeticks(uptime)
+    if uptime is None:
+        return
+    
+    token = {"boot": time.time() - uptime / 100, "last_change": parse_timeticks(last_change)}
+    previous = oid_cache.get(ip, {}).get("topology")
+    
+    if previous and (abs(token["boot"] - previous["boot"]) > BOOT_TIME_TOLERANCE or token["last_change"] != previous["last_change"]):
+        logging.info(f"{ip}: Reboot or ifTable change detected, OID cache invalidated")
+        oid_cache.pop(ip, None)
+    
+    # Waktu boot dari token pertama dipertahankan supaya selisih kecil
+    # antar poll tidak menumpuk
+    if previous and ip in oid_cache:
+        token["boot"] = previous["boot"]
+    oid_cache.setdefault(ip, {})["topology"] = token
+
+
+async def get_system_info(ip):
+    """
+    Mengambil sysDescr, sysName, sysUpTime dan ifTableLastChange dalam satu
+    PDU snmpget. sysDescr sekaligus jadi cek reachability, sysUpTime dan
+    ifTableLastChange untuk validasi cache OID
+    Kalau agent menolak PDU (noSuchName/genErr, biasanya OID opsional),
+    OID yang hilang diambil ulang di PDU terpisah supaya OLT tidak
+    dianggap unreachable
+    Returns: (sys_descr, sys_name), sys_descr None jika OLT tidak menjawab
+    """
+    output = await run_snmp_command(
+        ip, [OID_SYS_DESCR, OID_SYS_NAME, OID_SYS_UPTIME, OID_IF_TABLE_LAST_CHANGE], walk=False, probe=True
+    )
+    if output is None:
+        return None, "Unknown"
+    
+    system = parse_snmp_get(output)
+    if OID_SYS_DESCR not in system:
+        system.update(await run_snmp_get(ip, [OID_SYS_DESCR, OID_SYS_NAME]))
+    if system.get(OID_SYS_DESCR) is None:
+        return None, "Unknown"
+    
+    # ifTableLastChange tidak didukung -> sysUpTime saja
+    if OID_SYS_UPTIME not in system:
+        system.update(await run_snmp_get(ip, [OID_SYS_UPTIME]))
+    check_oid_cache_token(ip, system.get(OID_SYS_UPTIME), system.get(OID_IF_TABLE_LAST_CHANGE))
+    return system.get(OID_SYS_DESCR), system.get(OID_SYS_NAME) or "Unknown"
+
+
+def read_oid_cache_file():
+    try:
+        with open(OID_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_oid_cache():
+    global oid_cache
+    oid_cache = read_oid_cache_file()
+
+
+def is_oid_cache_stale(entries, now):
+    times = [entry["time"] for entry in entries.values() if "time" in entry]
+    return not times or now - max(times) >= REFRESH_OIDS_CACHE_INTERVAL
+
+
+def save_oid_cache(ip_list):
+    """
+    Simpan cache OID untuk IP di ip_list
+    File dipakai bersama semua script vendor, jadi isi file dibaca ulang
+    dan hanya entry IP run ini yang diganti. IP yang semua entry-nya
+    sudah lewat REFRESH_OIDS_CACHE_INTERVAL (misal sudah dihapus dari
+    olt.txt) dibuang. Ditulis ke file sementara lalu os.replace supaya
+    run lain tidak pernah membaca file setengah jadi.
+    """
+    now = time.time()
+    merged = read_oid_cache_file()
+    for ip in ip_list:
+        merged.pop(ip, None)
+        if ip in oid_cache:
+            merged[ip] = oid_cache[ip]
+    merged = {ip: entries for ip, entries in merged.items() if not is_oid_cache_stale(entries, now)}
+    
+    tmp_file = OID_CACHE_FILE.with_name(f"{OID_CACHE_FILE.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump(merged, f)
+        os.replace(tmp_file, OID_CACHE_FILE)
+    except OSError as e:
+        logging.warning(f"Could not save OID cache: {str(e)}")
+
+
+async def walk_and_cache_leaves(ip, oid):
+    """
+    Walk kolom OID dengan snmpbulkwalk lalu simpan leaf OID-nya di cache
+    Hanya baris di bawah oid yang bukan "No Such ..." yang jadi leaf,
+    kolom yang tidak ada di OLT tidak di-cache
+    Returns: output walk, None jika gagal atau kolom tidak ada
+    """
+    output = await run_snmp_command(ip, oid)
+    if not output:
+        return output
+    
+    prefix = f".{oid}.".encode()
+    leaves = []
+    for line in output.splitlines():
+        oid_part, eq, value = line.partition(b' = ')
+        if eq and oid_part.startswith(prefix) and not value.startswith(b"No Such"):
+            leaves.append(oid_part.lstrip(b'.').decode())
+    
+    if not leaves:
+        return None
+    
+    if oid not in OID_CACHE_EXCLUDE:
+        oid_cache.setdefault(ip, {})[oid] = {"time": time.time(), "leaves": leaves}
+    return output
+
+
+async def run_snmp_get_batches(ip, leaves):
+    """
+    GET leaves per OID_BATCH_SIZE OID, semua batch jalan bersamaan
+    (jumlah proses tetap dibatasi snmp_slots)
+    Returns: list (batch, output), output None jika batch gagal
+    """
+    batches = [leaves[i:i + OID_BATCH_SIZE] for i in range(0, len(leaves), OID_BATCH_SIZE)]
+    outputs = await asyncio.gather(*[run_snmp_command(ip, batch, walk=False) for batch in batches])
+    return list(zip(batches, outputs))
+
+
+def find_failed_columns(oids, results):
+    """
+    Kolom oids yang tidak lengkap di hasil run_snmp_get_batches
+    Batch yang gagal menggugurkan semua kolom di batch itu, baris
+    "No Such ..." hanya menggugurkan kolom baris itu sendiri
+    Returns: (set kolom gagal, True jika ada "No Such Instance")
+    """
+    prefixes = [(f"{oid}.", oid) for oid in sorted(oids, key=len, reverse=True)]
+    
+    def column_of(leaf):
+        return next((oid for prefix, oid in prefixes if leaf.startswith(prefix)), None)
+    
+    failed = set()
+    missing_instance = False
+    for batch, output in results:
+        if not output:
+            failed.update(column_of(leaf) for leaf in batch)
+            continue
+        for line in output.splitlines():
+            oid_part, eq, value = line.partition(b' = ')
+            if eq and value.startswith(b"No Such"):
+                failed.add(column_of(oid_part.lstrip(b'.').decode()))
+                missing_instance = missing_instance or value.startswith(b"No Such Instance")
+    
+    failed.discard(None)
+    return failed, missing_instance
+
+
+async def run_snmp_walks_cached(ip, oids):
+    """
+    Walk beberapa kolom OID satu OLT dengan cache leaf OID per IP
+    Walk pertama pakai snmpbulkwalk, selanjutnya (selama
+    REFRESH_OIDS_CACHE_INTERVAL) leaf yang sudah diketahui dari semua
+    kolom digabung dan diambil dengan snmpget per OID_BATCH_SIZE OID,
+    jadi satu proses snmpget bisa melayani beberapa kolom.
+    Returns: dict {oid: output}
+    """
+    now = time.time()
+    entries = oid_cache.get(ip, {})
+    cached = [
+        oid for oid in oids
+        if oid not in OID_CACHE_EXCLUDE and oid in entries
+        and now - entries[oid]["time"] < REFRESH_OIDS_CACHE_INTERVAL
+    ]
+    outputs = {}
+    
+    if cached:
+        leaves = [leaf for oid in cached for leaf in entries[oid]["leaves"]]
+        results = await run_snmp_get_batches(ip, leaves)
+        # Leaf hilang (noSuchInstance) -> topologi berubah, kolom itu saja
+        # yang di-walk ulang
+        failed, _ = find_failed_columns(cached, results)
+        lines = b"".join(output for _, output in results if output).splitlines()
+        for oid in cached:
+            if oid in failed:
+                logging.info(f"{ip}: OID cache for {oid} invalidated")
+                continue
+            prefix = f".{oid}.".encode()
+            outputs[oid] = b"".join(line + b"\n" for line in lines if line.startswith(prefix))
+    
+    missing = [oid for oid in oids if oid not in outputs]
+    outputs.update(zip(missing, await asyncio.gather(*[walk_and_cache_leaves(ip, oid) for oid in missing])))
+    return outputs
+
+
+async def run_snmp_walk_cached(ip, oid):
+    """
+    run_snmp_walks_cached untuk satu kolom
+    """
+    return (await run_snmp_walks_cached(ip, [oid]))[oid]
+
+
+async def get_indexes_by_value(ip, oid, value, refresh=False):
+    """
+    Index baris kolom oid yang value-nya sama dengan value
+    (contoh: ifIndex dengan ifType 250), disimpan di cache OID per IP
+    selama REFRESH_OIDS_CACHE_INTERVAL
+    Returns: list index, None jika walk gagal
+    """
+    key = f"{oid}={value}"
+    entry = oid_cache.get(ip, {}).get(key)
+    if entry and not refresh and time.time() - entry["time"] < REFRESH_OIDS_CACHE_INTERVAL:
+        return entry["leaves"]
+    
+    output = await run_snmp_command(ip, oid)
+    if not output:
+        return None
+    
+    # Bandingkan value masih bytes, hanya index yang cocok di-decode
+    wanted = value.encode()
+    indexes = [idx.decode() for idx, v in iter_snmp_lines(output) if v == wanted]
+    oid_cache.setdefault(ip, {})[key] = {"time": time.time(), "leaves": indexes}
+    return indexes
+
+
+async def get_columns_by_index(ip, oids, indexes):
+    """
+    GET <oid>.<index> semua kolom oids untuk index yang sudah diketahui,
+    kolom-kolom digabung dalam PDU yang sama, per OID_BATCH_SIZE OID
+    Returns: ({oid: {index: value}}, True jika ada index yang hilang),
+    value kolom None jika ada leaf kolom itu yang gagal
+    """
+    leaves = [f"{oid}.{idx}" for idx in indexes for oid in oids]
+    results = await run_snmp_get_batches(ip, leaves)
+    failed, missing_instance = find_failed_columns(oids, results)
+    
+    values = {oid: None if oid in failed else {} for oid in oids}
+    for _, output in results:
+        if not output:
+            continue
+        for oid in oids:
+            if values[oid] is not None:
+                values[oid].update(parse_snmp_output(output, oid))
+    
+    return values, missing_instance
+
+
+async def get_indexed_columns(ip, index_oid, index_value, oids):
+    """
+    Ambil kolom oids hanya untuk index yang kolom index_oid-nya bernilai
+    index_value, tanpa walk seluruh kolom
+    Kalau ada index yang hilang (noSuchInstance), index di-discovery ulang sekali
+    Returns: (indexes, {oid: {index: value}}), indexes None jika discovery
+    gagal, value kolom None jika GET kolom itu gagal
+    """
+    for refresh in (False, True):
+        indexes = await get_indexes_by_value(ip, index_oid, index_value, refresh)
+        if indexes is None:
+            return None, {oid: None for oid in oids}
+        
+        values, missing_instance = await get_columns_by_index(ip, oids, indexes)
+        if not missing_instance or refresh:
+            return indexes, values
+        
+        logging.info(f"{ip}: Index cache for {index_oid} invalidated")
+
+
+def count_metric(buckets, metric):
+    total = sum(buckets.values())
+    if metric.values is None:
+        return total
+    
+    matched = sum(buckets[value] for value in metric.values)
+    return total - matched if metric.exclude else matched
+
+
+async def collect_metrics(ip, metrics):
+    """
+    Menghitung semua metrik di tabel METRICS vendor
+    Setiap OID hanya di-walk sekali walaupun dipakai beberapa metrik,
+    semua kolom di-walk bersamaan
+    Returns: dict {key: hitungan}, 0 untuk kolom yang gagal di-walk
+    """
+    oids = list(dict.fromkeys(metric.oid for metric in metrics))
+    cached_oids = [oid for oid in oids if oid not in OID_CACHE_EXCLUDE]
+    # Tabel ONT (tanpa cache) dihitung langsung dari stream stdout
+    streamed_oids = [oid for oid in oids if oid in OID_CACHE_EXCLUDE]
+    
+    outputs, *streamed = await asyncio.gather(
+        run_snmp_walks_cached(ip, cached_oids),
+        *[run_snmp_command(ip, oid, reader=count_stream_buckets) for oid in streamed_oids]
+    )
+    all_counts = {oid: count_integer_buckets(outputs[oid]) for oid in cached_oids}
+    all_counts.update(zip(streamed_oids, streamed))
+    
+    buckets = {}
+    for oid in oids:
+        counts = all_counts[oid]
+        if not counts:
+            logging.warning(f"{ip}: Could not walk {oid}")
+        buckets[oid] = counts or Counter()
+        
+        # Semua status ikut di-log (LOS, offline, dll), bukan hanya yang dihitung
+        if buckets[oid]:
+            logging.info(f"{ip}: {oid} status counts {dict(sorted(buckets[oid].items()))}")
+    
+    return {metric.key: count_metric(buckets[metric.oid], metric) for metric in metrics}
+
+
+async def collect_all(collect_olt_data, ip_list):
+    """
+    Jalankan collect_olt_data untuk semua IP dalam satu event loop
+    MAX_WORKERS worker mengambil IP berikutnya dari iterator bersama,
+    jadi jumlah task tetap walaupun daftar IP sangat panjang
+    Returns: list hasil (atau Exception) dengan urutan sama seperti ip_list
+    """
+    global snmp_slots
+    snmp_slots = asyncio.Semaphore(MAX_SNMP_PROCESSES)
+    
+    workers = min(MAX_WORKERS, len(ip_list))
+    logging.info(f"Concurrency: {workers} workers, max {MAX_SNMP_PROCESSES} snmp processes")
+    
+    results = [None] * len(ip_list)
+    pending = iter(enumerate(ip_list))
+    
+    async def worker():
+        for i, ip in pending:
+            try:
+                results[i] = await collect_olt_data(ip)
+            except Exception as e:
+                results[i] = e
+    
+    await asyncio.gather(*[worker() for _ in range(workers)])
+    return results
+
+
+def ip_sort_key(ip):
+    """
+    Key sort IP per oktet (10.0.0.2 sebelum 10.0.0.10)
+    Bagian yang bukan angka (hostname) dibandingkan sebagai teks
+    """
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in ip.split('.')]
+
+
+def run_all(collect_olt_data, ip_list):
+    """
+    Entry point dari main(): collect_all di event loop baru
+    Pakai uvloop (libuv) kalau terpasang untuk spawn/reap proses snmp
+    dan I/O pipe yang lebih murah, selain itu asyncio biasa
+    """
+    if uvloop and hasattr(uvloop, "run"):
+        return uvloop.run(collect_all(collect_olt_data, ip_list))
+    if uvloop:
+        # uvloop < 0.18 belum punya uvloop.run
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(collect_all(collect_olt_data, ip_list))
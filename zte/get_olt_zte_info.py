@@ -5,22 +5,44 @@ Mengambil metrik: Board, PON Port, ONT Information
 Tested on ZTE C600 V1.2.2
 """
 
-import pandas as pd
-import subprocess
+import asyncio
+import csv
+import json
 import re
+import sys
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import logging
+import queue
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener, MemoryHandler
 
-SNMP_COMMUNITY = "public"
-SNMP_VERSION = "2c"
-SNMP_TIMEOUT = 30
-MAX_WORKERS = 5
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-# Standard OIDs
-OID_SYS_DESCR = "1.3.6.1.2.1.1.1.0"
-OID_SYS_NAME = "1.3.6.1.2.1.1.5.0"
+# snmp_core.py ada di root repo, dipakai bersama semua script vendor
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from snmp_core import (
+    SNMP_COMMUNITY,
+    SNMP_COMMAND_TIMEOUT,
+    SNMP_RETRY_TIMEOUTS,
+    SNMP_PDU_TIMEOUT,
+    SNMP_PDU_RETRIES,
+    MAX_WORKERS,
+    SNMP_MAX_REPETITIONS_PER_OID,
+    OID_CACHE_EXCLUDE,
+    Metric,
+    get_indexed_columns,
+    collect_metrics,
+    get_system_info,
+    load_oid_cache,
+    save_oid_cache,
+    ip_sort_key,
+    run_all,
+    uvloop
+)
 
 # Interface OIDs (untuk PON port)
 OID_IF_TYPE = "1.3.6.1.2.1.2.2.1.3"
@@ -40,107 +62,69 @@ OID_ZTE_ONU_NAME = "1.3.6.1.4.1.3902.1082.500.10.2.3.3.1.2"
 # 6 = auth_failed
 # 7 = offline
 
+# max-repetitions GETBULK per kolom: hanya tabel ONU yang besar, card
+# dihitung dari ifIndex PON jadi tidak ada kolom board yang di-walk,
+# kolom lain pakai SNMP_MAX_REPETITIONS
+SNMP_MAX_REPETITIONS_PER_OID.update({
+    OID_ZTE_ONU_STATUS: 50,
+})
+OID_CACHE_EXCLUDE.add(OID_ZTE_ONU_STATUS)
+
+# Metrik yang cukup dihitung dari satu kolom
+# Online = status 1 (logging), 3 (sync_mib), 4 (working)
+METRICS = (
+    Metric(OID_ZTE_ONU_STATUS, "ont_installed"),
+    Metric(OID_ZTE_ONU_STATUS, "ont_online", ("1", "3", "4")),
+)
+
+# Regex model OLT dari sysDescr
+_RE_ZTE_C600 = re.compile(r'C6[0-2]0', re.IGNORECASE)
+_RE_ZXA10 = re.compile(r'ZXA10[^\s,]+')
+
 output_dir = Path("output") / datetime.now().strftime("%Y-%m-%d")
 output_dir.mkdir(parents=True, exist_ok=True)
 
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 log_file = output_dir / f"olt_snmp_{timestamp}.log"
 
+# Record masuk queue, file/console ditulis oleh thread listener
+# supaya event loop tidak menunggu I/O log
+# File log ditulis per 1000 record (langsung jika ada ERROR) dan baru
+# dibuka saat record pertama ditulis
+log_queue = queue.Queue(-1)
+log_file_handler = MemoryHandler(
+    1000,
+    flushLevel=logging.ERROR,
+    target=logging.FileHandler(log_file, delay=True)
+)
+log_listener = QueueListener(
+    log_queue,
+    log_file_handler,
+    logging.StreamHandler()
+)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
 
 
-def run_snmp_command(ip, oid, walk=True):
-    try:
-        cmd = [
-            "snmpwalk" if walk else "snmpget",
-            "-v", SNMP_VERSION,
-            "-c", SNMP_COMMUNITY,
-            "-t", str(SNMP_TIMEOUT),
-            "-r", "2",
-            ip,
-            oid
-        ]
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=SNMP_TIMEOUT + 10
-        )
-        
-        return result.stdout if result.returncode == 0 else None
-            
-    except:
-        return None
-
-
-def parse_snmp_output(output, full_index=False):
-    if not output:
-        return {}
-    
-    data = {}
-    lines = output.strip().split('\n')
-    
-    for line in lines:
-        if '=' not in line:
-            continue
-            
-        parts = line.split('=', 1)
-        if len(parts) != 2:
-            continue
-            
-        oid_part = parts[0].strip()
-        value_part = parts[1].strip()
-        
-        if full_index:
-            # Untuk ONT: ambil compound index (contoh: 285278465.1)
-            pattern = r'\.(\d+\.\d+)$'
-            match = re.search(pattern, oid_part)
-            index = match.group(1) if match else oid_part.split('.')[-1]
-        else:
-            # Untuk Interface: ambil hanya angka terakhir
-            index = oid_part.split('.')[-1]
-        
-        value = re.sub(r'^[A-Za-z\-]+:\s*', '', value_part)
-        value = value.strip('"').strip()
-        
-        data[index] = value
-    
-    return data
-
-
-def get_olt_model(ip):
-    output = run_snmp_command(ip, OID_SYS_DESCR, walk=False)
-    if output:
+def parse_olt_model(sys_descr):
+    if sys_descr:
         # ZTE format: "ZXA10 C600, ZTE ZXA10 Software Version: V1.2.2"
-        match = re.search(r'C6[0-2]0', output, re.IGNORECASE)
+        match = _RE_ZTE_C600.search(sys_descr)
         if match:
             return f"ZTE-{match.group(0)}"
-        match = re.search(r'ZXA10[^\s,]+', output)
+        match = _RE_ZXA10.search(sys_descr)
         if match:
             return match.group(0)
-        if 'ZXA10' in output or 'C600' in output or 'C620' in output:
+        if 'ZXA10' in sys_descr or 'C600' in sys_descr or 'C620' in sys_descr:
             return 'ZTE-C600'
     return "Unknown"
 
 
-def get_olt_sysname(ip):
-    output = run_snmp_command(ip, OID_SYS_NAME, walk=False)
-    if output:
-        parts = output.split('=')
-        if len(parts) > 1:
-            value = re.sub(r'^[A-Za-z\-]+:\s*', '', parts[1].strip())
-            return value.strip('"').strip()
-    return "Unknown"
-
-
+@lru_cache(maxsize=4096)
 def decode_zte_ifindex(ifindex):
     """
     Decode ZTE ifIndex to shelf/slot/port
@@ -150,135 +134,62 @@ def decode_zte_ifindex(ifindex):
     - Board2Pon1: 285278721 (0x11010201)
     Format: shelf.rack.slot.port (1 byte each)
     Byte ketiga (0-255) adalah slot number
+    Hasil di-cache, ifIndex yang sama muncul lagi di setiap poll
     """
-    try:
-        idx = int(ifindex)
-        # Extract slot from byte 3 (counting from right: byte 0,1,2,3)
-        # Slot is at position (idx >> 8) & 0xFF
-        slot = (idx >> 8) & 0xFF
-        return str(slot)
-    except:
+    if not ifindex.isdigit():
         return None
+    
+    # Extract slot from byte 3 (counting from right: byte 0,1,2,3)
+    # Slot is at position (idx >> 8) & 0xFF
+    slot = (int(ifindex) >> 8) & 0xFF
+    return str(slot)
 
 
-def get_board_status(ip):
+def compute_board_status(ip, pon_indexes, admin_status):
     """
     Menghitung card/board berdasarkan PON interfaces
     Setiap card memiliki multiple PON ports
     """
-    try:
-        type_output = run_snmp_command(ip, OID_IF_TYPE)
-        admin_output = run_snmp_command(ip, OID_IF_ADMIN_STATUS)
-        
-        if not type_output:
-            logging.warning(f"{ip}: Could not get interface type")
-            return {"installed": 0, "used": 0}
-        
-        types = parse_snmp_output(type_output, full_index=False)
-        admin_status = parse_snmp_output(admin_output, full_index=False) if admin_output else {}
-        
-        # Identifikasi card berdasarkan ifIndex PON port (ifType 250)
-        cards = set()
-        active_cards = set()
-        
-        for idx, iftype in types.items():
-            if iftype == "250":  # GPON port
-                slot = decode_zte_ifindex(idx)
-                if slot:
-                    cards.add(slot)
-                    # Card dianggap active jika ada port yang admin up
-                    if admin_status.get(idx) == "1":
-                        active_cards.add(slot)
-        
-        installed = len(cards)
-        used = len(active_cards)
-        
-        if installed > 0:
-            logging.info(f"{ip}: Found {installed} cards, {used} active")
-            return {"installed": installed, "used": used}
-        
-        logging.warning(f"{ip}: Could not determine card count")
-        return {"installed": 0, "used": 0}
-        
-    except Exception as e:
-        logging.error(f"Error getting card status for {ip}: {str(e)}")
-        return {"installed": 0, "used": 0}
+    cards = set()
+    active_cards = set()
+    
+    for idx in pon_indexes:
+        slot = decode_zte_ifindex(idx)
+        if slot:
+            cards.add(slot)
+            # Card dianggap active jika ada port yang admin up
+            if admin_status.get(idx) == "1":
+                active_cards.add(slot)
+    
+    installed = len(cards)
+    used = len(active_cards)
+    
+    if installed > 0:
+        logging.info(f"{ip}: Found {installed} cards, {used} active")
+        return {"installed": installed, "used": used}
+    
+    logging.warning(f"{ip}: Could not determine card count")
+    return {"installed": 0, "used": 0}
 
 
-def get_pon_port_status(ip):
+def compute_pon_status(ip, pon_indexes, oper_status):
     """
-    Mengambil status PON port dari interface table
-    ifType 250 = GPON port
+    Menghitung PON port dari interface table
     Returns: dict dengan 'installed' (total PON port) dan 'used' (PON port yang UP)
     """
-    try:
-        type_output = run_snmp_command(ip, OID_IF_TYPE)
-        oper_output = run_snmp_command(ip, OID_IF_OPER_STATUS)
-        
-        if not type_output or not oper_output:
-            logging.warning(f"{ip}: Could not get interface data")
-            return {"installed": 0, "used": 0}
-        
-        types = parse_snmp_output(type_output, full_index=False)
-        oper_status = parse_snmp_output(oper_output, full_index=False)
-        
-        installed = 0
-        used = 0
-        
-        for idx, iftype in types.items():
-            if iftype == "250":  # GPON port
-                installed += 1
-                # operStatus 1 = UP
-                if oper_status.get(idx) == "1":
-                    used += 1
-        
-        logging.info(f"{ip}: Found {installed} PON ports, {used} UP")
-        return {"installed": installed, "used": used}
-        
-    except Exception as e:
-        logging.error(f"Error getting PON port status for {ip}: {str(e)}")
-        return {"installed": 0, "used": 0}
-
-
-def get_ont_status(ip):
-    """
-    Mengambil status ONT/ONU dari ZTE C600
-    ONU Status values:
-    - 1 = logging
-    - 2 = LOS
-    - 3 = sync_mib  
-    - 4 = working (online)
-    - 5 = dying_gasp
-    - 6 = auth_failed
-    - 7 = offline
+    installed = len(pon_indexes)
+    used = 0
     
-    Returns: dict dengan 'installed' (total ONT terdaftar) dan 'online' (ONT yang online)
-    """
-    try:
-        onu_output = run_snmp_command(ip, OID_ZTE_ONU_STATUS)
-        
-        if not onu_output:
-            logging.warning(f"{ip}: Could not get ONU data")
-            return {"installed": 0, "online": 0}
-        
-        statuses = parse_snmp_output(onu_output, full_index=True)
-        
-        # Total ONU yang terdaftar
-        installed = len(statuses)
-        
-        # ONU yang online: status 1 (logging), 3 (sync_mib), 4 (working)
-        online_statuses = ["1", "3", "4"]
-        online = sum(1 for status in statuses.values() if status in online_statuses)
-        
-        logging.info(f"{ip}: Found {installed} ONU installed, {online} online")
-        return {"installed": installed, "online": online}
-        
-    except Exception as e:
-        logging.error(f"Error getting ONU status for {ip}: {str(e)}")
-        return {"installed": 0, "online": 0}
+    for idx in pon_indexes:
+        # operStatus 1 = UP
+        if oper_status.get(idx) == "1":
+            used += 1
+    
+    logging.info(f"{ip}: Found {installed} PON ports, {used} UP")
+    return {"installed": installed, "used": used}
 
 
-def collect_olt_data(ip):
+async def collect_olt_data(ip):
     logging.info(f"Processing OLT: {ip}")
     
     result = {
@@ -296,33 +207,46 @@ def collect_olt_data(ip):
     }
     
     try:
-        test = run_snmp_command(ip, OID_SYS_DESCR, walk=False)
-        if not test:
+        sys_descr, sys_name = await get_system_info(ip)
+        if sys_descr is None:
             result["error"] = "timeout/unreachable"
             logging.warning(f"{ip}: Timeout/Unreachable")
             return result
         
-        result["sysname"] = get_olt_sysname(ip)
-        result["model"] = get_olt_model(ip)
+        result["sysname"] = sys_name
+        result["model"] = parse_olt_model(sys_descr)
+        
+        # Semua walk setelah sysDescr jalan bersamaan
+        # ifType 250 = GPON port, card dan PON port dihitung dari
+        # ifIndex PON yang sama, adminStatus+operStatus dalam satu GET
+        (pon_indexes, columns), metrics = await asyncio.gather(
+            get_indexed_columns(ip, OID_IF_TYPE, "250", [OID_IF_ADMIN_STATUS, OID_IF_OPER_STATUS]),
+            collect_metrics(ip, METRICS)
+        )
         
-        board_status = get_board_status(ip)
+        # adminStatus opsional, tanpa operStatus PON port tidak dihitung
+        admin_status = columns[OID_IF_ADMIN_STATUS]
+        oper_status = columns[OID_IF_OPER_STATUS]
+        board_status = compute_board_status(ip, pon_indexes or [], admin_status or {})
+        if oper_status is None:
+            logging.warning(f"{ip}: Could not get interface data")
+            pon_status = {"installed": 0, "used": 0}
+        else:
+            pon_status = compute_pon_status(ip, pon_indexes, oper_status)
         result["board_installed"] = board_status["installed"]
         result["board_used"] = board_status["used"]
         
-        pon_status = get_pon_port_status(ip)
         result["pon_port_installed"] = pon_status["installed"]
         result["pon_port_used"] = pon_status["used"]
         
-        ont_status = get_ont_status(ip)
-        result["ont_installed"] = ont_status["installed"]
-        result["ont_online"] = ont_status["online"]
+        result.update(metrics)
         
         result["status"] = "OK"
         logging.info(f"{ip}: OK - {result['sysname']} | Board: {result['board_used']}/{result['board_installed']} | PON: {result['pon_port_used']}/{result['pon_port_installed']} | ONT: {result['ont_online']}/{result['ont_installed']}")
         
     except Exception as e:
         result["error"] = str(e)
-        logging.error(f"{ip}: Error - {str(e)}")
+        logging.error(f"{ip}: Error - {str(e)}", exc_info=True)
     
     return result
 
@@ -343,8 +267,12 @@ def main():
     
     try:
         with open(input_file, 'r') as f:
-            ip_list = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-        ip_list = list(set(ip_list))
+            # Hapus duplikat lalu urutkan per oktet, urutan proses,
+            # log dan output jadi sama di setiap run
+            ip_list = sorted(
+                dict.fromkeys(line.strip() for line in f if line.strip() and not line.startswith('#')),
+                key=ip_sort_key
+            )
     except Exception as e:
         print(f"Error membaca file: {str(e)}")
         return
@@ -354,45 +282,66 @@ def main():
         return
     
     print(f"\nTotal IP: {len(ip_list)}")
-    print(f"Max workers: {MAX_WORKERS}")
+    print(f"Max workers: {min(MAX_WORKERS, len(ip_list))} (OLT_MAX_WORKERS={MAX_WORKERS})")
+    print(f"Event loop: {'uvloop' if uvloop else 'asyncio'}")
     print(f"SNMP Community: {SNMP_COMMUNITY}")
-    print(f"Timeout: {SNMP_TIMEOUT}s\n")
+    print(f"Timeout: {'/'.join(map(str, SNMP_RETRY_TIMEOUTS))}s cek reachability, {SNMP_PDU_TIMEOUT}s x {SNMP_PDU_RETRIES + 1} per PDU, {SNMP_COMMAND_TIMEOUT}s per perintah\n")
     
     logging.info(f"Memulai proses untuk {len(ip_list)} IP")
+    load_oid_cache()
     
     results = []
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_ip = {executor.submit(collect_olt_data, ip): ip for ip in ip_list}
-        
-        for future in as_completed(future_to_ip):
-            try:
-                results.append(future.result())
-            except Exception as e:
-                ip = future_to_ip[future]
-                logging.error(f"Exception untuk {ip}: {str(e)}")
-                results.append({"ip": ip, "status": "error", "error": str(e)})
+    for ip, result in zip(ip_list, run_all(collect_olt_data, ip_list)):
+        if isinstance(result, Exception):
+            logging.error(f"Exception untuk {ip}: {str(result)}", exc_info=result)
+            result = {"ip": ip, "status": "error", "error": str(result)}
+        results.append(result)
+    
+    save_oid_cache(ip_list)
     
-    df = pd.DataFrame(results).sort_values('ip').reset_index(drop=True)
+    # Semua baris punya kolom yang sama (baris error diisi None),
+    # urutan sudah sama dengan ip_list
+    fieldnames = list(dict.fromkeys(key for result in results for key in result))
+    rows = [{key: result.get(key) for key in fieldnames} for result in results]
     
     base = f"olt_data_{timestamp}"
     csv_file = output_dir / f"{base}.csv"
     json_file = output_dir / f"{base}.json"
     
-    df.to_csv(csv_file, index=False)
-    df.to_json(json_file, orient='records', indent=2)
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    if orjson:
+        json_file.write_bytes(orjson.dumps(rows, option=orjson.OPT_INDENT_2))
+    else:
+        with open(json_file, 'w') as f:
+            json.dump(rows, f, indent=2)
     
     print(f"\n✓ CSV: {csv_file}")
     print(f"✓ JSON: {json_file}")
     print(f"✓ Log: {log_file}")
     
-    total = len(results)
-    success = len([r for r in results if r['status'] == 'OK'])
-    total_board_installed = sum([r.get('board_installed', 0) for r in results if r['status'] == 'OK'])
-    total_board_used = sum([r.get('board_used', 0) for r in results if r['status'] == 'OK'])
-    total_pon_installed = sum([r.get('pon_port_installed', 0) for r in results if r['status'] == 'OK'])
-    total_pon_used = sum([r.get('pon_port_used', 0) for r in results if r['status'] == 'OK'])
-    total_ont_installed = sum([r.get('ont_installed', 0) for r in results if r['status'] == 'OK'])
-    total_ont_online = sum([r.get('ont_online', 0) for r in results if r['status'] == 'OK'])
+    # Success dan semua total dihitung dalam satu pass
+    total = len(rows)
+    success = 0
+    totals = dict.fromkeys([
+        'board_installed', 'board_used',
+        'pon_port_installed', 'pon_port_used',
+        'ont_installed', 'ont_online'
+    ], 0)
+    for row in rows:
+        if row['status'] != 'OK':
+            continue
+        success += 1
+        for key in totals:
+            totals[key] += row[key]
+    total_board_installed = totals['board_installed']
+    total_board_used = totals['board_used']
+    total_pon_installed = totals['pon_port_installed']
+    total_pon_used = totals['pon_port_used']
+    total_ont_installed = totals['ont_installed']
+    total_ont_online = totals['ont_online']
     
     print(f"\n{'=' * 70}")
     print(f"SUMMARY")
@@ -414,4 +363,9 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    log_listener.start()
+    try:
+        main()
+    finally:
+        log_listener.stop()
+        log_file_handler.close()